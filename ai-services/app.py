@@ -1,42 +1,140 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
 import os
+
+# Request threads already use every core, so BLAS/OpenMP pools inside
+# NumPy and ONNX Runtime must not spawn a thread per core on top of them.
+# This has to happen before those libraries are imported.
+for _var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+from flask import Flask, request
+from flask_cors import CORS
+from flask_compress import Compress
+import importlib.util
+import logging
+import mmap
+import orjson
+import msgpack
+import numpy as np
+import cv2
 from models.model_loader import model_loader
-from utils.image_preprocessor import ImagePreprocessor
+from models.batch_predictor import BatchPredictor
+from utils.image_preprocessor import ImagePreprocessor, detect_image_format
 import time
 
+# One line per record and no timestamps; the process manager adds those
+logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+# LOG_LEVEL covers the service's own loggers; libraries stay at WARNING
+for name in (__name__, 'models'):
+    logging.getLogger(name).setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+# Same for OpenCV's resize pool: one request is resized per thread
+cv2.setNumThreads(1)
+
 app = Flask(__name__)
 CORS(app)
 
 # Enable response compression
 app.config['COMPRESS_MIMETYPES'] = ['application/json']
 app.config['COMPRESS_LEVEL'] = 6
-
-# Initialize image preprocessor with optimization
-image_preprocessor = ImagePreprocessor(target_size=(224, 224), max_dimension=1024)
+app.config['COMPRESS_MIN_SIZE'] = 1024  # Small responses aren't worth compressing
+# Prefer Brotli when it is installed; it is smaller than gzip at similar CPU cost
+if importlib.util.find_spec('brotli') is not None:
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+else:
+    app.config['COMPRESS_ALGORITHM'] = ['gzip']
+Compress(app)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+ALLOWED_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.webp'})
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+
+def json_response(data, status=200):
+    """Build a JSON response serialized with orjson"""
+    return app.response_class(
+        orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+def msgpack_response(data, status=200):
+    """Build a MessagePack response"""
+    return app.response_class(
+        msgpack.packb(data),
+        status=status,
+        mimetype='application/msgpack'
+    )
+
+
+def wants_msgpack():
+    """Check whether the client asked for a MessagePack response"""
+    if request.args.get('format') == 'msgpack':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/msgpack'])
+    return best == 'application/msgpack'
+
+
+def read_upload(file):
+    """
+    Get the contents of an uploaded file as a memoryview
+    
+    Werkzeug spools small uploads in memory, in a BytesIO whose buffer is
+    exposed without copying; uploads rolled over to disk are memory-mapped
+    rather than read onto the heap. The caller must release() the view
+    when done.
+    """
+    # SpooledTemporaryFile keeps its in-memory BytesIO in _file until it
+    # rolls over to a real temporary file
+    buffered = getattr(file.stream, '_file', file.stream)
+    if hasattr(buffered, 'getbuffer'):
+        return buffered.getbuffer()
+    try:
+        mapped = mmap.mmap(buffered.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Not backed by a real file, or empty (which mmap rejects)
+        return memoryview(file.stream.read())
+    return memoryview(mapped)
+
+
 # Load ML model at startup
-print("Initializing AI Craft Recognition Service...")
+logger.info("Initializing AI Craft Recognition Service...")
 model = model_loader.load_model()
-print("Service ready!")
+
+# Initialize image preprocessor with optimization
+image_preprocessor = ImagePreprocessor(
+    target_size=(224, 224),
+    max_dimension=1024,
+    max_bytes=app.config['MAX_CONTENT_LENGTH'],
+    # Re-uploaded images (client retries, duplicates) skip decoding
+    cache_size=int(os.environ.get('PREPROCESS_CACHE_SIZE', 64)),
+    # Emit the model's input dtype directly (float16 for fp16 models)
+    dtype=getattr(model, 'input_dtype', np.float32)
+)
+logger.info("Image decoders: %s", image_preprocessor.decoder_info())
+
+# Coalesce concurrent requests into batched model calls
+predictor = BatchPredictor(
+    model,
+    max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 16))
+)
+logger.info("Service ready!")
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     model_info = model.get_info()
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'service': 'AI Craft Recognition Service',
         'model': model_info
-    }), 200
+    }, 200)
 
 
 @app.route('/predict', methods=['POST'])
@@ -47,131 +145,161 @@ def predict():
     Expected request format:
     - Content-Type: multipart/form-data
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
+    file_bytes = None
     
     try:
         # Check if image file is present in request
         if 'image' not in request.files:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': 'No image file provided'
-            }), 400
+            }, 400)
         
         file = request.files['image']
         
         # Check if file is selected
         if file.filename == '':
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': 'No file selected'
-            }), 400
+            }, 400)
         
         # Log incoming request for debugging
-        print(f"Received prediction request for: {file.filename}")
+        logger.debug("Received prediction request for: %s", file.filename)
         
         # Validate file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-        if not ('.' in file.filename and 
-                file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
-            return jsonify({
+        extension = os.path.splitext(file.filename)[1].lower()
+        if extension not in ALLOWED_EXTENSIONS:
+            return json_response({
                 'success': False,
                 'error': 'Invalid file type. Only images are allowed.'
-            }), 400
+            }, 400)
         
-        # Validate image integrity
-        validation_start = time.time()
+        # Read the upload once; every preprocessing step works on these bytes
+        file_bytes = read_upload(file)
+        
+        # Check the content really is an image before a decoder touches it
+        if detect_image_format(file_bytes) is None:
+            return json_response({
+                'success': False,
+                'error': 'Invalid file type. Only images are allowed.'
+            }, 400)
+        
+        # Validate, extract metadata and preprocess in a single decode pass
+        preprocess_start = time.perf_counter()
         try:
-            image_preprocessor.validate_image(file)
+            image_info, preprocessed_image = image_preprocessor.process(file_bytes)
         except ValueError as e:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': str(e)
-            }), 400
+            }, 400)
         
-        print(f"Validation time: {time.time() - validation_start:.3f}s")
+        preprocess_time = time.perf_counter() - preprocess_start
         
-        # Get image metadata before preprocessing
-        metadata_start = time.time()
-        image_info = image_preprocessor.get_image_info(file)
-        print(f"Metadata extraction time: {time.time() - metadata_start:.3f}s")
+        # Perform ML prediction
+        prediction_start = time.perf_counter()
+        prediction = predictor.predict(preprocessed_image)
+        prediction_time = time.perf_counter() - prediction_start
         
-        # Preprocess image
-        preprocess_start = time.time()
-        preprocessed_image = image_preprocessor.preprocess(file)
-        print(f"Preprocessing time: {time.time() - preprocess_start:.3f}s")
+        total_time = time.perf_counter() - start_time
+        top_prediction = prediction['top_prediction']
         
-        # Perform ML prediction
-        prediction_start = time.time()
-        prediction = model.predict(preprocessed_image)
-        print(f"Prediction time: {time.time() - prediction_start:.3f}s")
+        # A single record per request keeps logging off the hot path
+        logger.info(
+            "Predicted %s (%.2f) for %s in %.3fs (preprocess %.3fs, predict %.3fs)",
+            top_prediction['class'], top_prediction['confidence'], file.filename,
+            total_time, preprocess_time, prediction_time,
+            extra={'timings': {
+                'preprocess': preprocess_time,
+                'predict': prediction_time,
+                'total': total_time
+            }}
+        )
         
-        print(f"Prediction completed: {prediction['top_prediction']['class']} ({prediction['top_prediction']['confidence']:.2f})")
+        image_info_response = {
+            'filename': file.filename,
+            'dimensions': f"{image_info['width']}x{image_info['height']}",
+            'format': image_info['format']
+        }
         
-        total_time = time.time() - start_time
-        print(f"Total processing time: {total_time:.3f}s")
+        if wants_msgpack():
+            # Compact binary variant for internal consumers: a plain
+            # probabilities array parallel to the class list instead of
+            # one dict per class
+            return msgpack_response({
+                'success': True,
+                'craft_name': top_prediction['class'],
+                'confidence': top_prediction['confidence'],
+                'classes': model.classes,
+                'probabilities': np.asarray(prediction['probabilities']).tolist(),
+                'top_idx': prediction['top_index'],
+                'image_info': image_info_response,
+                'model_version': prediction['model_version'],
+                'processing_time': round(total_time, 3)
+            })
         
         # Format response with craft name and confidence
         response = {
             'success': True,
-            'craft_name': prediction['top_prediction']['class'],
-            'confidence': prediction['top_prediction']['confidence'],
+            'craft_name': top_prediction['class'],
+            'confidence': top_prediction['confidence'],
             'all_predictions': prediction['predictions'],
-            'image_info': {
-                'filename': file.filename,
-                'dimensions': f"{image_info['width']}x{image_info['height']}",
-                'format': image_info['format']
-            },
+            'image_info': image_info_response,
             'model_version': prediction['model_version'],
             'processing_time': round(total_time, 3)
         }
         
-        return jsonify(response), 200
+        return json_response(response)
         
     except ValueError as e:
-        print(f"Validation error: {str(e)}")
-        return jsonify({
+        logger.warning("Validation error: %s", e)
+        return json_response({
             'success': False,
             'error': 'Validation error',
             'message': str(e)
-        }), 400
+        }, 400)
     except Exception as e:
-        print(f"Prediction error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception("Prediction error: %s", e)
+        return json_response({
             'success': False,
             'error': 'An error occurred during prediction',
             'message': str(e)
-        }), 500
+        }, 500)
+    finally:
+        # Werkzeug can't close an in-memory upload while a view is exported
+        if file_bytes is not None:
+            file_bytes.release()
 
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error"""
-    return jsonify({
+    return json_response({
         'error': 'File too large. Maximum size is 16MB.'
-    }), 413
+    }, 413)
 
 
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
-    return jsonify({
+    return json_response({
         'error': 'Endpoint not found'
-    }), 404
+    }, 404)
 
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
-    return jsonify({
+    return json_response({
         'error': 'Internal server error'
-    }), 500
+    }, 500)
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
-    print(f"Starting Flask AI Service on port {port}...")
+    logger.info("Starting Flask AI Service on port %d...", port)
     app.run(host='0.0.0.0', port=port, debug=debug)
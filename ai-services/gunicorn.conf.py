@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for the AI Craft Recognition Service
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+
+# Threaded workers share one in-memory copy of the model, so scale with
+# threads rather than worker processes
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', os.cpu_count() or 1))
+
+# Load the app (and the model) in the master before forking workers, so
+# the model file is read from disk once and its bytes are shared
+# copy-on-write; each worker still builds its own inference session
+preload_app = True
@@ -1,5 +1,6 @@
 # Models package
 from models.craft_classifier import CraftClassifierModel
 from models.model_loader import model_loader
+from models.batch_predictor import BatchPredictor
 
-__all__ = ['CraftClassifierModel', 'model_loader']
+__all__ = ['CraftClassifierModel', 'model_loader', 'BatchPredictor']
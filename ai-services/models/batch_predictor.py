@@ -0,0 +1,113 @@
+"""
+Micro-batching for model inference
+
+Concurrent /predict requests each submit one preprocessed image; a
+background thread runs everything queued up to that point as a single
+batched model call. Requests arriving while the model is busy form the
+next batch, so batches grow with load without adding latency when the
+service is idle, and the CPU kernels get (N, 3, H, W) inputs instead of
+batch-size-1 calls.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchPredictor:
+    """Runs model predictions in batches collected from concurrent requests"""
+    
+    def __init__(self, model, max_batch_size=16):
+        """
+        Args:
+            model: Loaded model exposing predict_batch()
+            max_batch_size: Maximum number of images per model call
+        """
+        self.model = model
+        # Models exported with a fixed batch dimension take exactly that
+        # many images; they pad smaller batches themselves, so only larger
+        # ones have to be avoided
+        model_limit = getattr(model, 'fixed_batch_size', None)
+        self.max_batch_size = min(max_batch_size, model_limit or max_batch_size)
+        self._queue = None
+        self._worker_pid = None
+        self._batch_buffer = None
+        self._lock = threading.Lock()
+    
+    def _get_queue(self):
+        """Get the request queue, starting the batching thread if needed"""
+        # Threads do not survive fork, so when the app is preloaded in the
+        # gunicorn master, each worker process starts its own thread
+        pid = os.getpid()
+        if self._worker_pid != pid:
+            with self._lock:
+                if self._worker_pid != pid:
+                    self._queue = queue.Queue()
+                    worker = threading.Thread(
+                        target=self._run,
+                        args=(self._queue,),
+                        name='batch-predictor',
+                        daemon=True
+                    )
+                    worker.start()
+                    self._worker_pid = pid
+        return self._queue
+    
+    def predict(self, image_data):
+        """
+        Predict a single preprocessed image
+        
+        Blocks until the batch containing the image has been run.
+        
+        Args:
+            image_data: Preprocessed (1, 3, H, W) image tensor
+        
+        Returns:
+            dict: Prediction results with classes and confidence scores
+        """
+        if self.max_batch_size <= 1:
+            return self.model.predict_batch(image_data)[0]
+        
+        future = Future()
+        self._get_queue().put((image_data, future))
+        return future.result()
+    
+    def _collect_batch(self, requests):
+        """Block for one request, then drain whatever else is already queued"""
+        batch = [requests.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _stack(self, batch):
+        """Copy a batch's images into the reusable batch input buffer"""
+        first = batch[0][0]
+        buffer = self._batch_buffer
+        if (buffer is None or buffer.shape[1:] != first.shape[1:]
+                or buffer.dtype != first.dtype):
+            buffer = np.empty((self.max_batch_size,) + first.shape[1:], dtype=first.dtype)
+            self._batch_buffer = buffer
+        # A leading slice of a C-contiguous array is itself contiguous
+        return np.concatenate([image_data for image_data, _ in batch],
+                              out=buffer[:len(batch)])
+    
+    def _run(self, requests):
+        """Batching thread main loop"""
+        while True:
+            batch = self._collect_batch(requests)
+            try:
+                images = self._stack(batch)
+                results = self.model.predict_batch(images)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -5,7 +5,55 @@ This is a mock model that simulates ML predictions.
 Replace this with actual TensorFlow/PyTorch model when ready.
 """
 
-import random
+import numpy as np
+
+# Craft categories, in the output order of the trained classifier
+CRAFT_CLASSES = [
+    'pottery',
+    'sculpture',
+    'textile',
+    'woodwork',
+    'metalwork',
+    'jewelry',
+    'painting',
+    'embroidery'
+]
+
+# Concentration of the placeholder model's mock confidence distribution
+MOCK_DIRICHLET_ALPHA = 0.5
+
+
+def format_predictions(classes, probabilities, model_version):
+    """
+    Build the prediction result dict from per-class probabilities
+    
+    Args:
+        classes: Class names, aligned with probabilities
+        probabilities: Confidence score per class
+        model_version: Version string of the model that produced them
+        
+    Returns:
+        dict: Prediction results with classes and confidence scores, plus
+        the raw probabilities in class order and the top class's index
+    """
+    # Round in one vectorized call; tolist() yields plain Python floats
+    confidences = np.round(np.asarray(probabilities, dtype=np.float64), 4)
+    
+    # Highest confidence first
+    order = np.argsort(-confidences)
+    confidences = confidences.tolist()
+    predictions = [
+        {'class': classes[i], 'confidence': confidences[i]}
+        for i in order
+    ]
+    
+    return {
+        'predictions': predictions,
+        'top_prediction': predictions[0],
+        'top_index': int(order[0]),
+        'probabilities': probabilities,
+        'model_version': model_version
+    }
 
 
 class CraftClassifierModel:
@@ -13,17 +61,9 @@ class CraftClassifierModel:
     
     def __init__(self):
         self.model_version = "1.0.0-placeholder"
-        self.classes = [
-            'pottery',
-            'sculpture',
-            'textile',
-            'woodwork',
-            'metalwork',
-            'jewelry',
-            'painting',
-            'embroidery'
-        ]
+        self.classes = list(CRAFT_CLASSES)
         self.is_loaded = False
+        self._rng = np.random.default_rng()
     
     def load(self):
         """Simulate model loading"""
@@ -43,46 +83,38 @@ class CraftClassifierModel:
         Returns:
             dict: Prediction results with classes and confidence scores
         """
-        if not self.is_loaded:
-            raise RuntimeError("Model not loaded. Call load() first.")
-        
         # Simulate prediction processing time
         # In production, this would:
         # 1. Preprocess the image
         # 2. Run inference through the model
         # 3. Post-process predictions
         
-        # Generate mock predictions with random confidences
-        predictions = []
-        remaining_confidence = 1.0
-        
-        # Shuffle classes for variety
-        shuffled_classes = self.classes.copy()
-        random.shuffle(shuffled_classes)
+        return self.predict_batch([image_data])[0]
+    
+    def predict_batch(self, images):
+        """
+        Simulate ML prediction for a batch of images
         
-        for i, class_name in enumerate(shuffled_classes):
-            if i == len(shuffled_classes) - 1:
-                # Last class gets remaining confidence
-                confidence = remaining_confidence
-            else:
-                # Generate random confidence, decreasing for lower ranks
-                max_confidence = remaining_confidence * (0.8 if i == 0 else 0.3)
-                confidence = random.uniform(0.01, max_confidence)
-                remaining_confidence -= confidence
+        Args:
+            images: Preprocessed image batch (N, 3, H, W)
             
-            predictions.append({
-                'class': class_name,
-                'confidence': round(confidence, 4)
-            })
+        Returns:
+            list: Prediction results, one dict per image
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model not loaded. Call load() first.")
         
-        # Sort by confidence (descending)
-        predictions.sort(key=lambda x: x['confidence'], reverse=True)
+        # Sample mock confidences from a Dirichlet distribution; alpha < 1
+        # concentrates mass on a few classes, like a confident classifier
+        probabilities = self._rng.dirichlet(
+            np.full(len(self.classes), MOCK_DIRICHLET_ALPHA),
+            size=len(images)
+        )
         
-        return {
-            'predictions': predictions,
-            'top_prediction': predictions[0],
-            'model_version': self.model_version
-        }
+        return [
+            format_predictions(self.classes, row, self.model_version)
+            for row in probabilities
+        ]
     
     def get_info(self):
         """Get model information"""
@@ -4,20 +4,52 @@ Model Loader Module
 Handles loading and initialization of ML models
 """
 
+import os
+import threading
+
 from models.craft_classifier import CraftClassifierModel
 
+DEFAULT_MODEL_PATH = 'models/craft_classifier.onnx'
+
 
 class ModelLoader:
     """Manages ML model loading and caching"""
     
     def __init__(self):
         self._model = None
+        self._lock = threading.Lock()
+    
+    def _create_model(self):
+        """
+        Create the ONNX model if MODEL_PATH points to an exported model,
+        otherwise fall back to the placeholder model
+        
+        LOAD_MODEL=0 forces the placeholder, skipping ONNX Runtime import
+        and session setup (useful for tests and fast cold starts).
+        """
+        if os.environ.get('LOAD_MODEL', '1') != '1':
+            return CraftClassifierModel()
+        
+        model_path = os.environ.get('MODEL_PATH', DEFAULT_MODEL_PATH)
+        if model_path.endswith('.onnx') and os.path.exists(model_path):
+            # Imported here so the placeholder path does not need onnxruntime
+            from models.onnx_classifier import OnnxCraftClassifierModel
+            return OnnxCraftClassifierModel(model_path)
+        return CraftClassifierModel()
     
     def load_model(self):
-        """Load the craft classifier model"""
+        """
+        Load the craft classifier model
+        
+        The model is a process-wide singleton; concurrent callers wait for
+        the first load instead of loading their own copy.
+        """
         if self._model is None:
-            self._model = CraftClassifierModel()
-            self._model.load()
+            with self._lock:
+                if self._model is None:
+                    model = self._create_model()
+                    model.load()
+                    self._model = model
         return self._model
     
     def get_model(self):
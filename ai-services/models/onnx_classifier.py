@@ -0,0 +1,267 @@
+"""
+ONNX Runtime Craft Classifier
+
+Serves an exported craft classification CNN through ONNX Runtime.
+If a statically quantized INT8 copy of the model (``<name>.int8.onnx``,
+see ``models/quantize.py``) sits next to the FP32 file and the CPU
+supports VNNI, the INT8 model is served instead.
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+import onnxruntime as ort
+
+from models.craft_classifier import CRAFT_CLASSES, format_predictions
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_supports_vnni():
+    """
+    Check whether the CPU has VNNI int8 dot-product instructions
+    
+    Without VNNI, INT8 convolutions fall back to slower AVX2 code paths
+    and can end up slower than the FP32 model.
+    
+    Returns:
+        bool: True if AVX512-VNNI or AVX-VNNI is available
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpuinfo = f.read()
+    except OSError:
+        return False
+    return 'avx512_vnni' in cpuinfo or 'avx_vnni' in cpuinfo
+
+
+def intra_op_threads():
+    """
+    Get the number of threads ONNX Runtime may use within one inference
+    
+    BatchPredictor funnels each worker process's inference through a
+    single thread, so each worker's session gets an equal share of the
+    cores. ORT_INTRA_OP_THREADS overrides the computed value.
+    """
+    if os.environ.get('ORT_INTRA_OP_THREADS'):
+        return int(os.environ['ORT_INTRA_OP_THREADS'])
+    workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+# NumPy dtypes of the ONNX tensor types accepted as image input
+ONNX_INPUT_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16
+}
+
+
+def quantized_model_path(model_path):
+    """Get the path of the INT8 model stored next to an FP32 model"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+class OnnxCraftClassifierModel:
+    """
+    Craft classification model running on ONNX Runtime
+    
+    The model takes a normalized (N, 3, H, W) float32 or float16 tensor
+    and outputs raw class logits of shape (N, num_classes). Class names and version
+    are read from the model's custom metadata (``classes`` as a
+    comma-separated list, ``version``) when present.
+    """
+    
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model_version = None
+        self.classes = list(CRAFT_CLASSES)
+        self.quantized = False
+        self.session = None
+        self._model_bytes = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._local = threading.local()
+        self.input_name = None
+        self.input_dtype = np.float32
+        self.output_name = None
+        self.fixed_batch_size = None
+        self.is_loaded = False
+    
+    def _select_model_file(self):
+        """Pick the INT8 model when it exists and the CPU can run it fast"""
+        int8_path = quantized_model_path(self.model_path)
+        if os.path.exists(int8_path):
+            if cpu_supports_vnni():
+                return int8_path, True
+            logger.warning("INT8 model found but CPU lacks VNNI, using FP32 model")
+        return self.model_path, False
+    
+    def _create_session(self):
+        """Create an inference session from the in-memory model"""
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Pin thread counts so sessions in multiple workers don't oversubscribe
+        session_options.intra_op_num_threads = intra_op_threads()
+        session_options.inter_op_num_threads = 1
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        
+        self.session = ort.InferenceSession(
+            self._model_bytes,
+            sess_options=session_options,
+            providers=['CPUExecutionProvider']
+        )
+        self._session_pid = os.getpid()
+    
+    def _get_session(self):
+        """
+        Get the inference session for the current process
+        
+        When the app is preloaded in the gunicorn master, the session's
+        thread pools do not survive the fork, so each worker builds its
+        own session once from the model bytes it shares with the master.
+        All request threads of a worker then share that session, as
+        InferenceSession.run() is thread-safe.
+        """
+        if self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session_pid != os.getpid():
+                    self._create_session()
+        return self.session
+    
+    def load(self):
+        """Read the model and its input and output metadata"""
+        path, self.quantized = self._select_model_file()
+        logger.info("Loading ONNX model from %s...", path)
+        
+        # Kept in memory so forked workers share it copy-on-write
+        with open(path, 'rb') as f:
+            self._model_bytes = f.read()
+        self._create_session()
+        
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        if model_input.type not in ONNX_INPUT_DTYPES:
+            raise ValueError(f"Unsupported model input type: {model_input.type}")
+        self.input_dtype = ONNX_INPUT_DTYPES[model_input.type]
+        self.output_name = self.session.get_outputs()[0].name
+        # A symbolic batch dimension means any batch size is accepted; a
+        # fixed one means ONNX Runtime only accepts exactly that many images
+        if isinstance(model_input.shape[0], int):
+            self.fixed_batch_size = model_input.shape[0]
+        
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if metadata.get('classes'):
+            self.classes = [name.strip() for name in metadata['classes'].split(',')]
+        version = metadata.get('version') or os.path.splitext(os.path.basename(self.model_path))[0]
+        self.model_version = f"{version}-int8" if self.quantized else version
+        
+        # Only the model bytes are shared with forked workers; drop this
+        # session so each process builds its own on first use instead of
+        # the master keeping an extra initialized copy of the weights
+        self.session = None
+        self._session_pid = None
+        
+        self.is_loaded = True
+        logger.info("Model loaded successfully (version: %s)", self.model_version)
+    
+    def _get_binding(self, session):
+        """Get this thread's IO binding for the given session"""
+        local = self._local
+        if getattr(local, 'session', None) is not session:
+            local.binding = session.io_binding()
+            local.session = session
+        return local.binding
+    
+    def _pad_batch(self, images):
+        """
+        Pad a partial batch up to the model's fixed batch size
+        
+        The padding rows are copied into this thread's reusable buffer
+        and their outputs are dropped by _run().
+        """
+        count = len(images)
+        if count > self.fixed_batch_size:
+            raise ValueError(
+                f"Batch of {count} images exceeds the model's fixed batch "
+                f"size of {self.fixed_batch_size}"
+            )
+        padded = getattr(self._local, 'padded', None)
+        if (padded is None or padded.shape[1:] != images.shape[1:]
+                or padded.dtype != images.dtype):
+            padded = np.zeros((self.fixed_batch_size,) + images.shape[1:], dtype=images.dtype)
+            self._local.padded = padded
+        padded[:count] = images
+        return padded
+    
+    def _run(self, images):
+        """
+        Run the session on a batch, binding the input array in place
+        
+        Binding the array's memory directly lets ONNX Runtime read the
+        caller's (reused) buffer instead of copying it into a new tensor.
+        """
+        images = np.ascontiguousarray(images, dtype=self.input_dtype)
+        count = len(images)
+        if self.fixed_batch_size is not None and count != self.fixed_batch_size:
+            images = self._pad_batch(images)
+        session = self._get_session()
+        binding = self._get_binding(session)
+        binding.bind_input(
+            self.input_name, 'cpu', 0, self.input_dtype,
+            images.shape, images.ctypes.data
+        )
+        # Rebound every run: the output shape follows the batch size
+        binding.bind_output(self.output_name, 'cpu')
+        session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0][:count]
+    
+    def predict(self, image_data):
+        """
+        Run inference on a preprocessed image
+        
+        Args:
+            image_data: Normalized (1, 3, H, W) tensor of input_dtype
+        
+        Returns:
+            dict: Prediction results with classes and confidence scores
+        """
+        return self.predict_batch(image_data)[0]
+    
+    def predict_batch(self, images):
+        """
+        Run inference on a batch of preprocessed images
+        
+        Args:
+            images: Normalized (N, 3, H, W) tensor of input_dtype
+        
+        Returns:
+            list: Prediction results, one dict per image
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model not loaded. Call load() first.")
+        
+        # fp16 models return fp16 logits; do the softmax in float32
+        logits = self._run(images).astype(np.float32, copy=False)
+        
+        # Softmax over the class logits of each image
+        probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        
+        return [
+            format_predictions(self.classes, row, self.model_version)
+            for row in probabilities
+        ]
+    
+    def get_info(self):
+        """Get model information"""
+        return {
+            'version': self.model_version,
+            'classes': self.classes,
+            'num_classes': len(self.classes),
+            'is_loaded': self.is_loaded,
+            'type': 'onnx',
+            'quantized': self.quantized
+        }
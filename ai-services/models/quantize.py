@@ -0,0 +1,109 @@
+"""
+Static INT8 quantization for the ONNX craft classifier
+
+Calibrates activation ranges on a folder of representative craft images
+and writes ``<name>.int8.onnx`` next to the FP32 model, where
+OnnxCraftClassifierModel picks it up automatically.
+
+Usage:
+    python -m models.quantize models/craft_classifier.onnx path/to/calibration/images
+
+Static (calibrated) quantization is used rather than dynamic quantization,
+which only helps MatMul-heavy models and leaves CNN convolutions in FP32.
+Requires the ``onnx`` package in addition to onnxruntime.
+"""
+
+import argparse
+import os
+import tempfile
+
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from models.onnx_classifier import quantized_model_path
+from utils.image_preprocessor import ImagePreprocessor
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+
+class CraftCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed calibration images to the quantizer"""
+    
+    def __init__(self, model_path, image_dir, target_size=(224, 224)):
+        session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        self.preprocessor = ImagePreprocessor(target_size=target_size)
+        self.image_paths = sorted(
+            os.path.join(image_dir, name)
+            for name in os.listdir(image_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self._iterator = iter(self.image_paths)
+    
+    def get_next(self):
+        for path in self._iterator:
+            with open(path, 'rb') as f:
+                try:
+                    _, tensor = self.preprocessor.process(f.read())
+                except ValueError:
+                    print(f"Skipping unreadable calibration image: {path}")
+                    continue
+            # The preprocessor reuses its output buffer, so hand over a copy
+            return {self.input_name: tensor.copy()}
+        return None
+    
+    def rewind(self):
+        self._iterator = iter(self.image_paths)
+
+
+def quantize_model(model_path, image_dir, output_path=None):
+    """
+    Quantize an FP32 ONNX model to INT8 (QDQ format)
+    
+    Args:
+        model_path: Path to the FP32 ONNX model
+        image_dir: Folder with representative calibration images
+        output_path: Destination path (defaults to <name>.int8.onnx)
+    
+    Returns:
+        str: Path of the quantized model
+    """
+    output_path = output_path or quantized_model_path(model_path)
+    reader = CraftCalibrationReader(model_path, image_dir)
+    if not reader.image_paths:
+        raise ValueError(f"No calibration images found in {image_dir}")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference + graph cleanup so the quantizer sees every tensor
+        prepared_path = os.path.join(tmp_dir, 'prepared.onnx')
+        quant_pre_process(model_path, prepared_path, skip_symbolic_shape=True)
+        
+        print(f"Calibrating on {len(reader.image_paths)} images...")
+        # U8 activations x S8 weights is the operand layout VNNI accelerates
+        quantize_static(
+            prepared_path,
+            output_path,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+    print(f"Quantized model written to {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize the craft classifier to INT8')
+    parser.add_argument('model_path', help='Path to the FP32 ONNX model')
+    parser.add_argument('image_dir', help='Folder of representative calibration images')
+    parser.add_argument('--output', help='Output path (default: <model>.int8.onnx)')
+    args = parser.parse_args()
+    
+    quantize_model(args.model_path, args.image_dir, args.output)
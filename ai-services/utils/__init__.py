@@ -1,4 +1,4 @@
 # Utils package
-from utils.image_preprocessor import ImagePreprocessor
+from utils.image_preprocessor import ImagePreprocessor, detect_image_format
 
-__all__ = ['ImagePreprocessor']
+__all__ = ['ImagePreprocessor', 'detect_image_format']
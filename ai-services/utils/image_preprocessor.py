@@ -2,129 +2,579 @@
 Image preprocessing utilities for ML model inference
 """
 
-from PIL import Image
+import PIL
+from PIL import Image, UnidentifiedImageError, features
+import numpy as np
+import cv2
+import hashlib
 import io
+import threading
+from collections import OrderedDict
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:  # PyTurboJPEG is optional; OpenCV decodes JPEGs without it
+    TurboJPEG = None
+
+try:
+    import numba
+except ImportError:  # Numba is optional; OpenCV's LUT normalizes without it
+    numba = None
+
+# ImageNet channel statistics, used by most pretrained CNN backbones
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Images with a side longer than max_dimension times this, or more than
+# max_dimension squared times MAX_PIXELS_FACTOR pixels in total (about
+# 50 megapixels by default), are rejected before decoding
+MAX_DIMENSION_FACTOR = 8
+MAX_PIXELS_FACTOR = 48
+
+# Default cap on the encoded file size
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+# DCT scaling denominators libjpeg-turbo can decode at, largest first
+JPEG_SCALE_DENOMINATORS = (8, 4, 2)
+
+# End of image marker, the last two bytes of a complete JPEG
+JPEG_END_MARKER = b'\xff\xd9'
+
+# OpenCV imdecode flag for each JPEG scaling denominator
+OPENCV_JPEG_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Formats decoded with OpenCV; anything else (GIF) goes through Pillow
+OPENCV_FORMATS = frozenset({'JPEG', 'PNG', 'WEBP'})
+
+
+if numba is not None:
+    # Compiled eagerly for the layouts _prepare() passes in, so the first
+    # request doesn't pay for JIT compilation. Single-threaded on purpose:
+    # request threads already keep every core busy, and nogil lets them
+    # run the kernel concurrently.
+    @numba.njit('void(uint8[:, :, ::1], float32[:, ::1], float32[:, :, ::1])',
+                cache=True, nogil=True, fastmath=True)
+    def _normalize_kernel(pixels, luts, out):
+        """Look up each HWC pixel's channel values into planar CHW output"""
+        height, width, channels = pixels.shape
+        for c in range(channels):
+            lut = luts[c]
+            for y in range(height):
+                for x in range(width):
+                    out[c, y, x] = lut[pixels[y, x, c]]
+    
+    # The first call still sets up the dispatcher; do it at import time
+    _normalize_kernel(np.zeros((1, 1, 3), dtype=np.uint8),
+                      np.zeros((3, 256), dtype=np.float32),
+                      np.zeros((3, 1, 1), dtype=np.float32))
+else:
+    _normalize_kernel = None
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    Read-only file object over a bytes-like buffer, without copying it
+    
+    io.BytesIO only shares the memory of an actual bytes object; given a
+    memoryview (an in-memory upload's buffer, or an mmap of a spooled
+    one) it copies the whole file up front. This reader only copies the
+    chunks Pillow asks for.
+    """
+    
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer).cast('B')
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, b):
+        chunk = self._buffer[self._position:self._position + len(b)]
+        b[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+    
+    def tell(self):
+        return self._position
+
+
+def detect_image_format(header):
+    """
+    Identify an image format from its leading magic bytes
+    
+    Args:
+        header: The first 12 or more bytes of the file
+        
+    Returns:
+        str: 'JPEG', 'PNG', 'GIF' or 'WEBP', or None if not recognized
+    """
+    header = bytes(header[:12])
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'GIF'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
 
 
 class ImagePreprocessor:
-    """Handles image preprocessing for model inference"""
+    """
+    Handles image preprocessing for model inference
+    
+    Images come out as normalized, C-contiguous NCHW tensors of shape
+    (1, 3, H, W), the layout ONNX Runtime and PyTorch models take, so
+    they go to the model without a transpose or copy.
+    
+    Preprocessed tensors are written into a buffer owned by the calling
+    thread and reused on its next call, so consume (or copy) the result
+    before preprocessing another image on the same thread. With a cache,
+    process() may instead return a shared read-only tensor.
+    
+    Everything derived from the constructor arguments (lookup tables,
+    size thresholds, tensor shape) is computed once in __init__, so the
+    per-image path only moves pixels. One instance can be shared by all
+    request threads: per-call state lives in thread-local buffers and the
+    cache is locked.
+    """
+    
+    def __init__(self, target_size=(224, 224), max_dimension=1024,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, max_bytes=DEFAULT_MAX_BYTES,
+                 cache_size=0, dtype=np.float32):
+        self.target_size = tuple(target_size)  # (width, height)
+        target_width, target_height = self.target_size
+        self._tensor_shape = (3, target_height, target_width)
+        # Smallest source size that still covers the target after 1/k DCT
+        # scaling (libjpeg-turbo rounds scaled dimensions up)
+        self._jpeg_scale_limits = [
+            (denominator,
+             (target_width - 1) * denominator + 1,
+             (target_height - 1) * denominator + 1)
+            for denominator in JPEG_SCALE_DENOMINATORS
+        ]
+        # Shrinking by 2x or more switches the resize to area averaging
+        self._area_resize_limits = (2 * target_width, 2 * target_height)
+        # Tensor dtype; float16 halves the bytes handed to fp16 models
+        self.dtype = np.dtype(dtype)
+        self.max_dimension = max_dimension  # Bounds the accepted image size
+        self.max_side = max_dimension * MAX_DIMENSION_FACTOR
+        self.max_pixels = max_dimension * max_dimension * MAX_PIXELS_FACTOR
+        self.max_bytes = max_bytes  # Largest accepted encoded file
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1)
+        self.std = np.asarray(std, dtype=np.float32).reshape(3, 1, 1)
+        # (x / 255 - mean) / std for every uint8 value, one table per
+        # channel, baked in the output dtype so no cast pass is needed
+        levels = np.arange(256, dtype=np.float32)
+        self._luts = ((levels / 255.0 - self.mean.reshape(3, 1))
+                      / self.std.reshape(3, 1)).astype(self.dtype)
+        self._local = threading.local()
+        self._turbo_jpeg = self._load_turbo_jpeg()
+        # Recently processed uploads, most recent last; 0 disables it
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Normalize a blank image once, so a dtype the installed image
+        # libraries can't handle fails here at startup rather than as a
+        # 500 on every request
+        self._prepare(np.zeros((target_height, target_width, 3), dtype=np.uint8))
+    
+    @staticmethod
+    def _load_turbo_jpeg():
+        """Create the libjpeg-turbo decoder, or None if it is unavailable"""
+        if TurboJPEG is None:
+            return None
+        try:
+            return TurboJPEG()
+        except (RuntimeError, OSError):
+            # The Python package is installed but libturbojpeg is not
+            return None
+    
+    def decoder_info(self):
+        """
+        Describe the image libraries backing this preprocessor
+        
+        Returns:
+            dict: Pillow version, whether it is the pillow-simd fork (which
+            versions itself ``X.Y.Z.postN``), whether its JPEG codec is
+            libjpeg-turbo, whether the PyTurboJPEG fast path is active and
+            whether normalization runs in the Numba kernel
+        """
+        return {
+            'pillow': PIL.__version__,
+            'pillow_simd': '.post' in PIL.__version__,
+            'pillow_libjpeg_turbo': bool(features.check_feature('libjpeg_turbo')),
+            'turbojpeg': self._turbo_jpeg is not None,
+            'numba': _normalize_kernel is not None
+        }
     
-    def __init__(self, target_size=(224, 224), max_dimension=1024):
-        self.target_size = target_size
-        self.max_dimension = max_dimension  # Maximum dimension before resizing
+    def _input_buffer(self):
+        """Get this thread's reusable (1, 3, H, W) input buffer"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = np.empty((1,) + self._tensor_shape, dtype=self.dtype)
+            self._local.buffer = buffer
+        return buffer
     
-    def _optimize_image_size(self, image):
+    @staticmethod
+    def _read_once(file):
         """
-        Reduce image dimensions if too large to speed up processing
+        Get the raw bytes of an upload
+        
+        Accepts bytes-like content as is. File objects are read in full
+        and rewound, so callers that hold on to the upload can still use
+        it; pass the bytes instead to avoid reading it more than once.
         
         Args:
-            image: PIL Image object
+            file: Uploaded file object (Flask FileStorage) or its raw bytes
             
         Returns:
-            PIL.Image: Optimized image
+            bytes-like: The file content
         """
-        width, height = image.size
-        max_dim = max(width, height)
+        if not hasattr(file, 'read'):
+            return file
+        file_content = file.read()
+        file.seek(0)
+        return file_content
+    
+    @staticmethod
+    def _open_stream(file_content):
+        """Wrap file content in a file object for Pillow without copying it"""
+        if isinstance(file_content, bytes):
+            return io.BytesIO(file_content)
+        return _BufferReader(file_content)
+    
+    def _jpeg_scale_denominator(self, size):
+        """
+        Pick the DCT scaling denominator for decoding a JPEG
         
-        # Only resize if image is larger than max_dimension
-        if max_dim > self.max_dimension:
-            scale = self.max_dimension / max_dim
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            return image.resize((new_width, new_height), Image.LANCZOS)
+        Large images are scaled down by 1/2, 1/4 or 1/8 during the IDCT,
+        which is nearly free: the largest factor is used that still leaves
+        at least target_size pixels for the final resize.
         
-        return image
+        Args:
+            size: (width, height) from the JPEG header
+            
+        Returns:
+            int: 8, 4, 2, or 1 for a full-size decode
+        """
+        width, height = size
+        for denominator, min_width, min_height in self._jpeg_scale_limits:
+            if width >= min_width and height >= min_height:
+                return denominator
+        return 1
     
-    def validate_image(self, file):
+    def _decode_jpeg(self, file_content, size):
         """
-        Validate that the uploaded file is a valid image
+        Decode a JPEG to RGB with libjpeg-turbo's SIMD decoder
         
         Args:
-            file: Uploaded file object (Flask FileStorage)
+            file_content: Raw JPEG bytes
+            size: (width, height) from the JPEG header
             
         Returns:
-            bool: True if valid, raises exception otherwise
+            numpy.ndarray: RGB image (H, W, 3) as uint8
         """
-        try:
-            # Read file content into memory
-            file_content = file.read()
-            
-            # Try to open image from bytes
-            image = Image.open(io.BytesIO(file_content))
-            image.verify()
-            
-            # Reset file pointer to beginning
-            file.seek(0)
-            return True
-        except Exception as e:
-            # Reset file pointer even on error
-            try:
-                file.seek(0)
-            except:
-                pass
-            raise ValueError(f"Invalid image file: {str(e)}")
+        denominator = self._jpeg_scale_denominator(size)
+        scaling_factor = (1, denominator) if denominator > 1 else None
+        return self._turbo_jpeg.decode(file_content, pixel_format=TJPF_RGB,
+                                       scaling_factor=scaling_factor)
     
-    def preprocess(self, file):
+    def _decode_opencv(self, file_content, image):
         """
-        Preprocess image for model inference
+        Decode an image to RGB with OpenCV
+        
+        OpenCV bundles libjpeg-turbo, libpng and libwebp and decodes
+        straight into a numpy array, skipping Pillow's image object and
+        the copy out of it. JPEGs use the same DCT scaling as
+        _decode_jpeg().
         
         Args:
-            file: Uploaded file object (Flask FileStorage)
+            file_content: Raw image bytes
+            image: The lazily opened Pillow image (header only)
             
         Returns:
-            PIL.Image: Preprocessed image
+            numpy.ndarray: RGB image (H, W, 3) as uint8
+            
+        Raises:
+            ValueError: If OpenCV cannot decode the bytes
         """
-        # Read file content into memory
-        file_content = file.read()
-        
-        # Open image from bytes
-        image = Image.open(io.BytesIO(file_content))
+        if image.format == 'JPEG':
+            flags = OPENCV_JPEG_READ_FLAGS[self._jpeg_scale_denominator(image.size)]
+        else:
+            flags = cv2.IMREAD_COLOR
+        # Pillow does not apply EXIF rotation either; keep the two paths
+        # consistent with each other and with the reported dimensions
+        flags |= cv2.IMREAD_IGNORE_ORIENTATION
         
-        # Optimize image size for faster processing
-        image = self._optimize_image_size(image)
+        pixels = cv2.imdecode(np.frombuffer(file_content, dtype=np.uint8), flags)
+        if pixels is None:
+            raise ValueError("Invalid image file: could not decode image data")
+        # OpenCV decodes to BGR; swap in place rather than allocating
+        return cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB, dst=pixels)
+    
+    def _check_file_size(self, file_content):
+        """
+        Reject files over max_bytes before any parsing
         
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        Raises:
+            ValueError: If the file is too large
+        """
+        if len(file_content) > self.max_bytes:
+            raise ValueError(
+                f"Image file is too large ({len(file_content)} bytes, "
+                f"max {self.max_bytes})"
+            )
+    
+    def _check_dimensions(self, image):
+        """
+        Reject decompression bombs from the header, before any pixel memory
+        is allocated or decode work is done
         
-        # Resize to target size
-        image = image.resize(self.target_size, Image.LANCZOS)
+        Args:
+            image: Lazily opened Pillow image (header only)
+            
+        Raises:
+            ValueError: If the image is too large to decode
+        """
+        width, height = image.size
+        if max(width, height) > self.max_side or width * height > self.max_pixels:
+            raise ValueError(
+                f"Image dimensions {width}x{height} are too large "
+                f"(max {self.max_side}px per side, {self.max_pixels} pixels)"
+            )
+    
+    def _decode(self, file_content):
+        """
+        Decode image bytes into RGB pixels
         
-        # In production, you would also:
-        # - Normalize pixel values
-        # - Convert to numpy array
-        # - Apply model-specific preprocessing
-        # Example:
-        # img_array = np.array(image) / 255.0
-        # img_array = np.expand_dims(img_array, axis=0)
+        Args:
+            file_content: Raw bytes of the uploaded file
+            
+        Returns:
+            tuple: (image metadata dict, RGB uint8 numpy.ndarray (H, W, 3))
+            
+        Raises:
+            ValueError: If the bytes are not a decodable image
+        """
+        self._check_file_size(file_content)
+        try:
+            image = Image.open(self._open_stream(file_content))
+            info = self._extract_info(image)
+            self._check_dimensions(image)
+            
+            # libjpeg-turbo and OpenCV (before 5.0) only warn about a
+            # truncated JPEG and return it padded with gray, so JPEGs that
+            # don't end in an EOI marker go to Pillow, which rejects them
+            # (and also copes with data appended after the image)
+            fast_jpeg = (image.format == 'JPEG' and image.mode in ('RGB', 'L')
+                         and bytes(file_content[-2:]) == JPEG_END_MARKER)
+            
+            # JPEG is the common upload format; use libjpeg-turbo when we can
+            if self._turbo_jpeg is not None and fast_jpeg:
+                return info, self._decode_jpeg(file_content, image.size)
+            
+            # CMYK JPEGs are left to Pillow, whose conversion we've always used
+            if image.format in OPENCV_FORMATS and (image.format != 'JPEG' or fast_jpeg):
+                return info, self._decode_opencv(file_content, image)
+            
+            # Let libjpeg decode the remaining JPEGs at 1/2, 1/4 or 1/8
+            # scale, keeping both sides at or above target_size (no-op for
+            # other formats)
+            image.draft('RGB', self.target_size)
+            
+            # Force the decode now so corrupt payloads fail validation here
+            image.load()
+            
+            # Convert to RGB if necessary
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f"Invalid image file: {str(e)}")
         
-        return image
+        return info, np.asarray(image)
     
-    def get_image_info(self, file):
+    def _prepare(self, pixels):
         """
-        Extract metadata from image
+        Convert decoded pixels into the model input layout
         
         Args:
-            file: Uploaded file object (Flask FileStorage)
+            pixels: RGB image as a uint8 numpy array (H, W, 3)
             
         Returns:
-            dict: Image metadata
+            numpy.ndarray: Normalized (1, 3, H, W) tensor of self.dtype
         """
-        # Read file content
-        file_content = file.read()
+        # Resize straight from the decoded size to target size with OpenCV,
+        # whose kernels are SIMD-vectorized
+        pixels = cv2.resize(pixels, self.target_size,
+                            interpolation=self._resize_interpolation(pixels))
         
-        # Open image from bytes
-        image = Image.open(io.BytesIO(file_content))
+        # Normalize each channel plane straight into the NCHW buffer with a
+        # table lookup: one pass that converts, scales and shifts at once
+        buffer = self._input_buffer()
+        if self.dtype != np.float32:
+            # Neither cv2.LUT (before OpenCV 5) nor Numba on CPU handles
+            # float16 tables; NumPy's gather does, reading the HWC channels
+            # through strided views
+            for c, (lut, channel) in enumerate(zip(self._luts, buffer[0])):
+                np.take(lut, pixels[..., c], out=channel)
+        elif _normalize_kernel is not None:
+            # Fuses the HWC -> CHW split into the lookup pass
+            _normalize_kernel(pixels, self._luts, buffer[0])
+        else:
+            for plane, lut, channel in zip(cv2.split(pixels), self._luts, buffer[0]):
+                cv2.LUT(plane, lut, dst=channel)
         
-        info = {
+        return buffer
+    
+    def _resize_interpolation(self, pixels):
+        """
+        Pick the OpenCV resize filter for an image
+        
+        Bilinear matches the resize used when the model was trained
+        (torchvision-style preprocessing), but aliases when shrinking by
+        2x or more, where area averaging (box filter) is used instead.
+        Both are far cheaper than Lanczos' 8-tap kernel.
+        """
+        height, width = pixels.shape[:2]
+        area_width, area_height = self._area_resize_limits
+        if width >= area_width or height >= area_height:
+            return cv2.INTER_AREA
+        return cv2.INTER_LINEAR
+    
+    @staticmethod
+    def _extract_info(image):
+        """
+        Build the metadata dict for an opened image
+        
+        Only reads fields Image.open() parses from the file header, so it
+        is safe to call before (or without) decoding the pixels.
+        """
+        return {
             'format': image.format,
             'mode': image.mode,
             'size': image.size,
             'width': image.width,
             'height': image.height
         }
+    
+    def validate_image(self, file):
+        """
+        Validate that the uploaded file is a valid image
         
-        # Reset file pointer for potential reuse
-        file.seek(0)
+        Only the magic bytes and header are parsed; a corrupt payload
+        behind a valid header is reported when preprocess() or process()
+        decodes it.
+        
+        Args:
+            file: Uploaded file object (Flask FileStorage) or its raw bytes
+            
+        Returns:
+            bool: True if valid, raises exception otherwise
+        """
+        file_content = self._read_once(file)
+        self._check_file_size(file_content)
+        try:
+            # Image.open() is lazy: it checks the magic bytes, parses the
+            # header and stops there
+            image = Image.open(self._open_stream(file_content))
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f"Invalid image file: {str(e)}")
+        self._check_dimensions(image)
+        return True
+    
+    def preprocess(self, file):
+        """
+        Preprocess image for model inference
+        
+        Args:
+            file: Uploaded file object (Flask FileStorage) or its raw bytes
+            
+        Returns:
+            numpy.ndarray: Normalized (1, 3, H, W) tensor of self.dtype
+            
+        Raises:
+            ValueError: If the bytes are not a decodable image
+        """
+        _, pixels = self._decode(self._read_once(file))
+        return self._prepare(pixels)
+    
+    def get_image_info(self, file):
+        """
+        Extract metadata from the image header without decoding pixels
+        
+        Args:
+            file: Uploaded file object (Flask FileStorage) or its raw bytes
+            
+        Returns:
+            dict: Image metadata
+            
+        Raises:
+            ValueError: If the bytes are not a recognized image
+        """
+        file_content = self._read_once(file)
+        try:
+            # Image.open() is lazy: it parses the header and stops there
+            image = Image.open(self._open_stream(file_content))
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f"Invalid image file: {str(e)}")
+        return self._extract_info(image)
+    
+    def process(self, file):
+        """
+        Validate, extract metadata and preprocess an image in one decode pass
+        
+        When the cache is enabled, re-uploads of recently seen files skip
+        decoding entirely and return the cached (read-only) tensor.
+        
+        Args:
+            file: Uploaded file object (Flask FileStorage) or its raw bytes
+            
+        Returns:
+            tuple: (image metadata dict, preprocessed numpy.ndarray)
+            
+        Raises:
+            ValueError: If the bytes are not a decodable image
+        """
+        file_content = self._read_once(file)
+        if not self.cache_size:
+            info, pixels = self._decode(file_content)
+            return info, self._prepare(pixels)
+        
+        self._check_file_size(file_content)
+        key = (hashlib.blake2b(file_content, digest_size=16).digest(), self.target_size)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            info, tensor = cached
+            return dict(info), tensor
         
-        return info
+        info, pixels = self._decode(file_content)
+        tensor = self._prepare(pixels).copy()
+        tensor.flags.writeable = False
+        with self._cache_lock:
+            self._cache[key] = (info, tensor)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(info), tensor